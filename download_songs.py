@@ -6,131 +6,216 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import mmap
 import os
+import random
+import shutil
+import sys
 import time
 import re
 from urllib.parse import urlparse
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# 下载块大小：128 KiB，大块读取减少系统调用和Python层循环开销
+CHUNK_SIZE = 128 * 1024
+
+# list.txt中单首歌曲条目的格式，模块加载时编译一次
+# 按字节匹配（配合mmap零拷贝扫描），只对命中的字段做UTF-8解码
+_SONG_RE = re.compile(
+    (r'(\d+)\.\s*(.+?)\s*-\s*(.+?)\s*\n'
+     r'\s*歌曲ID:\s*(\d+)\s*\n'
+     r'\s*音质:\s*(.+?)\s*\((\d+)kbps\)\s*\n'
+     r'\s*直链:\s*(.+?)\s*\n'
+     r'\s*大小:\s*(\d+)\s*bytes\s*\n'
+     r'\s*类型:\s*(.+?)\s*\n').encode('utf-8'),
+    re.MULTILINE
+)
+
+# Windows文件名中的非法字符 -> 下划线，预先构建转换表
+_ILLEGAL_TRANS = str.maketrans({c: '_' for c in '<>:"/\\|?*'})
+
+# 基础请求头：session创建时设置一次，之后不要修改session.headers
+# （多个工作线程共享同一个session，按请求的差异用per-request headers传递）
+BASE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://music.163.com/',
+    'Accept': '*/*',
+    'Accept-Encoding': 'gzip, deflate',  # 音频本身已压缩不会被再压，文本/JSON响应可受益
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Connection': 'keep-alive'
+}
+
+def _backoff_delay(attempt):
+    """重试前的等待时间：指数退避加随机抖动，首次重试很快，线程槽位尽早释放"""
+    return min(30, 0.25 * (2 ** attempt)) + random.uniform(0, 0.25)
+
 class SongDownloader:
     def __init__(self):
         self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': 'https://music.163.com/',
-            'Accept': '*/*',
-            'Accept-Encoding': 'identity',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Connection': 'keep-alive',
-            'Range': 'bytes=0-'  # 支持断点续传
-        })
+        # 注意：不要在session级别设置Range头，否则每个请求都带Range会干扰连接复用
+        # 需要断点续传时在单个请求上添加Range头
+        self.session.headers.update(BASE_HEADERS)
         
         # 创建下载目录
         self.download_dir = "downloads"
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
+
+        # 输出不是终端时（如重定向到日志）不显示进度，走更快的拷贝路径
+        self.show_progress = sys.stdout.isatty()
     
     def parse_list_file(self, filename="list.txt"):
-        """解析list.txt文件，提取歌曲信息"""
-        songs = []
+        """解析list.txt文件，逐首生成歌曲信息"""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 使用正则表达式提取歌曲信息
-            pattern = r'(\d+)\.\s*(.+?)\s*-\s*(.+?)\s*\n\s*歌曲ID:\s*(\d+)\s*\n\s*音质:\s*(.+?)\s*\((\d+)kbps\)\s*\n\s*直链:\s*(.+?)\s*\n\s*大小:\s*(\d+)\s*bytes\s*\n\s*类型:\s*(.+?)\s*\n'
-            matches = re.findall(pattern, content, re.MULTILINE)
-            
-            for match in matches:
-                song = {
-                    'index': int(match[0]),
-                    'name': match[1].strip(),
-                    'artist': match[2].strip(),
-                    'song_id': match[3],
-                    'quality': match[4].strip(),
-                    'bitrate': int(match[5]),
-                    'url': match[6].strip(),
-                    'size': int(match[7]),
-                    'type': match[8].strip()
-                }
-                songs.append(song)
-            
-            print(f"✓ 成功解析 {len(songs)} 首歌曲")
-            return songs
-            
+            with open(filename, 'rb') as f:
+                try:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    return  # 空文件
+
+                # 直接在mmap上按字节扫描，不把整个文件解码成str；只解码命中的字段
+                with mm:
+                    for m in _SONG_RE.finditer(mm):
+                        yield {
+                            'index': int(m.group(1)),
+                            'name': m.group(2).decode('utf-8').strip(),
+                            'artist': m.group(3).decode('utf-8').strip(),
+                            'song_id': m.group(4).decode('ascii'),
+                            'quality': m.group(5).decode('utf-8').strip(),
+                            'bitrate': int(m.group(6)),
+                            'url': m.group(7).decode('utf-8').strip(),
+                            'size': int(m.group(8)),
+                            'type': m.group(9).decode('utf-8').strip()
+                        }
         except Exception as e:
             print(f"❌ 解析文件失败: {e}")
-            return []
+            return
     
     def sanitize_filename(self, filename):
         """清理文件名，移除非法字符"""
-        # 移除或替换Windows文件名中的非法字符
-        illegal_chars = r'[<>:"/\\|?*]'
-        filename = re.sub(illegal_chars, '_', filename)
-        # 限制文件名长度
-        if len(filename) > 200:
-            filename = filename[:200]
+        # 替换Windows文件名中的非法字符
+        filename = filename.translate(_ILLEGAL_TRANS)
+        # 限制文件名长度（按UTF-8字节数算，文件系统限制的是字节长度）
+        if len(filename.encode('utf-8')) > 200:
+            filename = filename.encode('utf-8')[:200].decode('utf-8', 'ignore')
         return filename
     
-    def download_song(self, song, max_retries=3):
-        """下载单首歌曲"""
+    def get_song_filepath(self, song):
+        """构建歌曲的目标文件名和完整路径"""
+        filename = f"{song['index']:03d}. {song['name']} - {song['artist']}.{song['type']}"
+        filename = self.sanitize_filename(filename)
+        return filename, os.path.join(self.download_dir, filename)
+
+    def download_song(self, song, existing=None, max_retries=3):
+        """下载单首歌曲（完整文件的跳过判断已在提交任务前批量完成）
+
+        existing: 下载目录的 文件名->大小 快照，避免每个任务单独stat文件
+        """
         try:
-            # 构建文件名
-            filename = f"{song['index']:03d}. {song['name']} - {song['artist']}.{song['type']}"
-            filename = self.sanitize_filename(filename)
-            filepath = os.path.join(self.download_dir, filename)
-            
-            # 如果文件已存在且大小正确，跳过下载
-            if os.path.exists(filepath):
-                file_size = os.path.getsize(filepath)
-                if abs(file_size - song['size']) < 1024:  # 允许1KB的误差
-                    print(f"✓ [{song['index']:03d}] 文件已存在，跳过: {filename}")
-                    return True
-            
-            print(f"⏳ [{song['index']:03d}] 开始下载: {filename}")
-            
+            filename, filepath = self.get_song_filepath(song)
+
+            # 存在不完整文件则记录断点位置
+            if existing is not None:
+                file_size = existing.get(filename, 0)
+            else:
+                file_size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+            resume_from = file_size if 0 < file_size < song['size'] else 0
+
+            if resume_from:
+                print(f"⏳ [{song['index']:03d}] 断点续传 (从 {resume_from} bytes): {filename}")
+            else:
+                print(f"⏳ [{song['index']:03d}] 开始下载: {filename}")
+
             for attempt in range(max_retries):
                 try:
-                    response = self.session.get(song['url'], stream=True, timeout=30)
-                    
+                    # 重试前按文件当前实际大小重算断点：上一次尝试可能已经追加了
+                    # 一部分数据，快照里的大小已过期，沿用会导致Range偏移和
+                    # 追加位置错位、写出重叠数据
+                    if attempt:
+                        file_size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+                        resume_from = file_size if 0 < file_size < song['size'] else 0
+
+                    # Range头只在需要续传的请求上添加，不放在session级别
+                    headers = {'Range': f'bytes={resume_from}-'} if resume_from else None
+                    response = self.session.get(song['url'], headers=headers, stream=True, timeout=30)
+
                     if response.status_code == 200 or response.status_code == 206:
-                        # 获取文件大小
-                        total_size = int(response.headers.get('content-length', song['size']))
-                        
-                        with open(filepath, 'wb') as f:
-                            downloaded = 0
-                            for chunk in response.iter_content(chunk_size=8192):
-                                if chunk:
-                                    f.write(chunk)
-                                    downloaded += len(chunk)
-                                    
-                                    # 显示下载进度
-                                    if total_size > 0:
-                                        progress = (downloaded / total_size) * 100
-                                        print(f"\r⏳ [{song['index']:03d}] 下载进度: {progress:.1f}% ({downloaded}/{total_size} bytes)", end='', flush=True)
-                        
+                        if resume_from and response.status_code == 200:
+                            # 服务器不支持Range，返回了完整文件，从头覆盖写入
+                            resume_from = 0
+                        mode = 'ab' if resume_from else 'wb'
+
+                        # 获取文件大小（206时content-length只是剩余部分）
+                        total_size = int(response.headers.get('content-length', song['size'])) + resume_from
+
+                        # 1MB写缓冲，小块写入先在用户态合并再落盘
+                        with open(filepath, mode, buffering=1024 * 1024) as f:
+                            # 已知目标大小时一次性预分配，避免写入过程中反复扩展文件
+                            if mode == 'wb' and song['size'] > 0:
+                                try:
+                                    os.posix_fallocate(f.fileno(), 0, song['size'])
+                                except (AttributeError, OSError):
+                                    pass  # Windows或文件系统不支持时照常增量写入
+
+                            try:
+                                if not self.show_progress:
+                                    # 不需要进度显示时用C实现的拷贝循环，绕过Python层逐块处理
+                                    # （内核级零拷贝不可行：sendfile不能以socket为源，且响应体
+                                    # 开头部分已被http.client读入用户态缓冲，绕过会丢数据）
+                                    response.raw.decode_content = True
+                                    shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+                                else:
+                                    downloaded = resume_from
+                                    last_print = 0.0
+                                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE, decode_unicode=False):
+                                        if chunk:
+                                            f.write(chunk)
+                                            downloaded += len(chunk)
+
+                                            # 显示下载进度（最多每0.25秒刷新一次，避免stdout成为瓶颈）
+                                            now = time.monotonic()
+                                            if total_size > 0 and (now - last_print > 0.25 or downloaded >= total_size):
+                                                last_print = now
+                                                progress = (downloaded / total_size) * 100
+                                                print(f"\r⏳ [{song['index']:03d}] 下载进度: {progress:.1f}% ({downloaded}/{total_size} bytes)", end='', flush=True)
+                            finally:
+                                # 无论中断还是正常结束都截到实际写入位置：预分配的空尾巴
+                                # 会让文件大小看起来等于song['size']，下次运行被误判为
+                                # 已完整而跳过（响应体比记录的小时即使正常结束也会发生）；
+                                # 下载满长度时tell()就是文件末尾，截断是空操作
+                                f.truncate(f.tell())
+
+                            # 歌曲写完后不会再被读取，提示内核释放对应的页缓存
+                            try:
+                                f.flush()
+                                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                            except (AttributeError, OSError):
+                                pass  # Windows等平台没有posix_fadvise
+
                         print(f"\n✅ [{song['index']:03d}] 下载完成: {filename}")
                         return True
                         
                     elif response.status_code == 403:
                         print(f"❌ [{song['index']:03d}] 403错误，可能需要更新请求头")
                         if attempt < max_retries - 1:
-                            time.sleep(2)
+                            time.sleep(_backoff_delay(attempt))
                             continue
                         return False
                         
                     else:
                         print(f"❌ [{song['index']:03d}] HTTP {response.status_code}")
                         if attempt < max_retries - 1:
-                            time.sleep(2)
+                            time.sleep(_backoff_delay(attempt))
                             continue
                         return False
                         
                 except Exception as e:
                     print(f"❌ [{song['index']:03d}] 下载异常: {e}")
                     if attempt < max_retries - 1:
-                        time.sleep(2)
+                        time.sleep(_backoff_delay(attempt))
                         continue
                     return False
             
@@ -142,6 +227,43 @@ class SongDownloader:
     
     def download_all_songs(self, songs, max_workers=3):
         """并发下载所有歌曲"""
+        # 按并发数配置连接池，复用TCP/TLS连接避免每次下载重新握手
+        # 只让urllib3重试连接/读取失败；5xx等状态码交给download_song里的
+        # 重试循环处理，避免两层重试叠加放大对故障服务器的请求量
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers * 2,
+            max_retries=Retry(total=3, backoff_factor=0.5)
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # 一次scandir扫描下载目录，建立 文件名->大小 映射，替代每首歌曲的单独stat
+        existing = {}
+        for entry in os.scandir(self.download_dir):
+            if entry.is_file():
+                existing[entry.name] = entry.stat().st_size
+
+        # 先批量过滤掉已经下载完整的文件，避免为它们占用工作线程
+        to_download = []
+        skipped_count = 0
+        for song in songs:
+            filename, _ = self.get_song_filepath(song)
+            file_size = existing.get(filename)
+            if file_size is not None and abs(file_size - song['size']) < 1024:  # 允许1KB的误差
+                skipped_count += 1
+            else:
+                to_download.append(song)
+
+        if skipped_count:
+            print(f"✓ {skipped_count} 首歌曲已存在，跳过")
+        if not to_download:
+            print("✅ 所有歌曲都已下载完成")
+            return
+
+        # 按CDN主机名分组提交，相邻任务命中同一主机时可以直接复用连接池里的连接
+        songs = sorted(to_download, key=lambda s: urlparse(s['url']).netloc)
+
         print(f"\n🚀 开始下载 {len(songs)} 首歌曲...")
         print(f"📁 下载目录: {os.path.abspath(self.download_dir)}")
         print(f"🔧 并发数: {max_workers}")
@@ -151,7 +273,7 @@ class SongDownloader:
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             # 提交所有下载任务
-            future_to_song = {executor.submit(self.download_song, song): song for song in songs}
+            future_to_song = {executor.submit(self.download_song, song, existing): song for song in songs}
             
             # 处理完成的任务
             for future in as_completed(future_to_song):
@@ -183,7 +305,7 @@ def main():
         return
     
     # 解析歌曲列表
-    songs = downloader.parse_list_file()
+    songs = list(downloader.parse_list_file())
     if not songs:
         print("❌ 没有找到可下载的歌曲")
         return
@@ -202,9 +324,10 @@ def main():
         return
     
     # 询问并发数
+    # 瓶颈通常是每个请求的延迟而不是带宽，歌曲多时可以适当提高并发数
     try:
-        max_workers = int(input("请输入并发下载数 (建议1-5): ").strip() or "3")
-        max_workers = max(1, min(10, max_workers))  # 限制在1-10之间
+        max_workers = int(input("请输入并发下载数 (建议1-5，最高32): ").strip() or "3")
+        max_workers = max(1, min(32, max_workers))  # 限制在1-32之间
     except ValueError:
         max_workers = 3
     
@@ -7,24 +7,80 @@
 """
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import collections
+import logging
+import re
+import sqlite3
 import time
 import sys
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urlparse, parse_qs
+from dataclasses import dataclass
 from queue import Queue
 import os
+from tqdm import tqdm
+
+# API响应等调试输出走logging，默认级别下不做任何格式化开销
+logger = logging.getLogger(__name__)
+
+# 直链缓存的有效期（秒）：网易直链一般数小时内有效，这里取保守的30分钟
+_URL_CACHE_TTL = 1800
+
+# 歌单URL中的ID：匹配 ?id=123 / &id=123 或 playlist/123 两种形式
+_PL_ID_RE = re.compile(r'(?:[?&]id=|playlist/)(\d+)')
+
+@dataclass(slots=True)
+class UrlInfo:
+    """单首歌曲的直链信息（slots比dict省内存，歌单大时差别可观）"""
+    url: str
+    level: str
+    br: int
+    size: int
+    type: str
+    song_id: int
 
 class NeteaseMusicDownloader:
+    # 单首歌曲在list.txt中的条目模板，类定义时构建一次
+    _SONG_TMPL = (
+        "{index}. {name} - {artist}\n"
+        "   歌曲ID: {song_id}\n"
+        "   音质: {quality} ({bitrate}kbps)\n"
+        "   直链: {url}\n"
+        "   大小: {size} bytes\n"
+        "   类型: {type}\n"
+        "   下载说明: 此直链需要添加Referer请求头才能正常访问\n"
+        "   推荐下载工具: IDM、Aria2、curl等支持自定义请求头的工具\n"
+        "   必要请求头: Referer: https://music.163.com/\n"
+        "   User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36\n"
+        "\n"
+    )
+
     def __init__(self):
         # 网易云音乐API基础URL - 使用新的API服务器
         self.base_url = "https://163api.qijieya.cn"
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Connection': 'keep-alive',  # 明确要求保持连接，复用TCP/TLS
             'Cookie': 'os=pc'  # 确保返回正常码率的URL
         })
+
+        # 连接池 + 自动重试：复用到API服务器的持久连接，省掉每个请求的TCP/TLS握手
+        # 连接错误和5xx由urllib3按指数退避自动重试，各方法里不再手写重试循环
+        # allowed_methods=None让POST也参与重试：Retry默认排除POST，而这里的
+        # POST都是幂等的查询接口，语义上和GET没有区别
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.5,
+                              status_forcelist=[502, 503, 504],
+                              allowed_methods=None)
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
         # 音质选项
         self.quality_levels = {
@@ -43,6 +99,108 @@ class NeteaseMusicDownloader:
         self.lock = threading.Lock()
         self.processed_count = 0
         self.total_count = 0
+
+        # 自适应限速：记录最近10个请求的时间戳，只有把窗口挤满时才等待
+        # 服务器返回429/5xx时窗口翻倍（放慢），成功则窗口减半（加快）
+        self._rate_lock = threading.Lock()
+        self._request_times = collections.deque(maxlen=10)
+        self._rate_window = 1.0  # 最近10个请求允许的最小时间跨度（秒）
+
+        # list.txt的文件句柄，init_file打开，update_file_summary关闭
+        self._fh = None
+
+        # 直链磁盘缓存：重跑同一歌单时未过期的直链不再请求API
+        # 批量获取在线程池里跑，连接需关闭同线程检查并用锁保护
+        self._cache_lock = threading.Lock()
+        try:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+            os.makedirs(cache_dir, exist_ok=True)
+            self._cache = sqlite3.connect(os.path.join(cache_dir, 'netease_urls.db'),
+                                          check_same_thread=False)
+            self._cache.execute(
+                'CREATE TABLE IF NOT EXISTS urls('
+                'id INTEGER, level TEXT, url TEXT, br INTEGER, size INTEGER, '
+                'type TEXT, ts INTEGER, PRIMARY KEY(id, level))')
+            self._cache.commit()
+        except Exception as e:
+            logger.debug("初始化直链缓存失败: %s", e)
+            self._cache = None
+
+    def close(self):
+        """释放session、直链缓存和可能未关闭的文件句柄"""
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            except Exception:
+                pass
+            self._fh = None
+        if self._cache is not None:
+            try:
+                self._cache.close()
+            except Exception:
+                pass
+            self._cache = None
+        self.session.close()
+
+    # 支持 with NeteaseMusicDownloader() as downloader: 的用法，退出时自动清理
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def _cache_get(self, song_id, quality_level):
+        """查询未过期的缓存直链，没有则返回None"""
+        if self._cache is None:
+            return None
+        try:
+            with self._cache_lock:
+                row = self._cache.execute(
+                    'SELECT url, br, size, type, ts FROM urls WHERE id=? AND level=?',
+                    (song_id, quality_level)).fetchone()
+        except Exception as e:
+            logger.debug("读取直链缓存失败: %s", e)
+            return None
+        if not row or time.time() - row[4] >= _URL_CACHE_TTL:
+            return None
+        return UrlInfo(url=row[0], level=quality_level, br=row[1],
+                       size=row[2], type=row[3], song_id=song_id)
+
+    def _cache_put(self, url_info):
+        """把成功获取的直链写入缓存"""
+        if self._cache is None:
+            return
+        try:
+            with self._cache_lock:
+                self._cache.execute(
+                    'INSERT OR REPLACE INTO urls VALUES(?,?,?,?,?,?,?)',
+                    (url_info.song_id, url_info.level, url_info.url,
+                     url_info.br, url_info.size, url_info.type, int(time.time())))
+                self._cache.commit()
+        except Exception as e:
+            logger.debug("写入直链缓存失败: %s", e)
+
+    def _throttle(self):
+        """发API请求前调用，按当前窗口限制请求速率"""
+        with self._rate_lock:
+            wait = 0.0
+            if len(self._request_times) == self._request_times.maxlen:
+                elapsed = time.monotonic() - self._request_times[0]
+                if elapsed < self._rate_window:
+                    wait = self._rate_window - elapsed
+        if wait > 0:
+            time.sleep(wait)
+        with self._rate_lock:
+            self._request_times.append(time.monotonic())
+
+    def _report_response(self, status_code):
+        """根据服务器反馈调整限速窗口（AIMD）"""
+        with self._rate_lock:
+            if status_code == 429 or status_code >= 500:
+                self._rate_window = min(30.0, self._rate_window * 2)
+            else:
+                self._rate_window = max(0.25, self._rate_window / 2)
     
     def check_api_status(self):
         """检查API服务器状态"""
@@ -62,181 +220,127 @@ class NeteaseMusicDownloader:
     
     def extract_playlist_id(self, playlist_url):
         """从歌单URL中提取歌单ID"""
-        try:
-            # 处理不同的URL格式
-            if 'playlist' in playlist_url:
-                # 从URL中提取ID
-                parsed = urlparse(playlist_url)
-                if parsed.query:
-                    params = parse_qs(parsed.query)
-                    if 'id' in params:
-                        return params['id'][0]
-                else:
-                    # 从路径中提取ID
-                    path_parts = parsed.path.split('/')
-                    for i, part in enumerate(path_parts):
-                        if part == 'playlist' and i + 1 < len(path_parts):
-                            return path_parts[i + 1]
-            else:
-                # 假设直接输入的是ID
-                return playlist_url
-        except Exception as e:
-            print(f"提取歌单ID时出错: {e}")
-            return None
+        # 一次正则搜索覆盖各种URL格式（含 #/playlist?id=... 的hash路由形式）
+        m = _PL_ID_RE.search(playlist_url)
+        if m:
+            return m.group(1)
+        # 直接输入的是纯数字ID
+        return playlist_url if playlist_url.isdigit() else None
     
     def get_playlist_detail(self, playlist_id):
-        """获取歌单详情"""
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                url = f"{self.base_url}/playlist/detail"
-                data = {'id': playlist_id}
-                
-                print(f"正在获取歌单详情... (尝试 {attempt + 1}/{max_retries})")
-                response = self.session.post(url, data=data, timeout=30)
-                
-                if response.status_code == 404:
-                    print(f"歌单不存在或已被删除 (ID: {playlist_id})")
-                    return None
-                elif response.status_code == 403:
-                    print(f"访问被拒绝，可能需要登录或歌单为私有")
-                    return None
-                elif response.status_code != 200:
-                    print(f"API服务器返回错误: HTTP {response.status_code}")
-                    if attempt < max_retries - 1:
-                        print("等待3秒后重试...")
-                        time.sleep(3)
-                        continue
-                    return None
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                if data.get('code') == 200:
-                    playlist = data.get('playlist', {})
-                    if playlist:
-                        print(f"成功获取歌单信息")
-                        return playlist
-                    else:
-                        print("API返回成功但歌单信息为空")
-                        return None
-                else:
-                    print(f"获取歌单详情失败: {data.get('msg', '未知错误')}")
-                    if attempt < max_retries - 1:
-                        print("等待3秒后重试...")
-                        time.sleep(3)
-                        continue
-                    return None
-                    
-            except requests.exceptions.Timeout:
-                print(f"请求超时 (尝试 {attempt + 1}/{max_retries})")
-                if attempt < max_retries - 1:
-                    print("等待3秒后重试...")
-                    time.sleep(3)
-                    continue
+        """获取歌单详情（瞬时错误由连接池的Retry自动重试）"""
+        try:
+            url = f"{self.base_url}/playlist/detail"
+            data = {'id': playlist_id}
+
+            print("正在获取歌单详情...")
+            response = self.session.post(url, data=data, timeout=30)
+
+            if response.status_code == 404:
+                print(f"歌单不存在或已被删除 (ID: {playlist_id})")
                 return None
-            except requests.exceptions.ConnectionError:
-                print(f"网络连接错误 (尝试 {attempt + 1}/{max_retries})")
-                if attempt < max_retries - 1:
-                    print("等待3秒后重试...")
-                    time.sleep(3)
-                    continue
+            elif response.status_code == 403:
+                print(f"访问被拒绝，可能需要登录或歌单为私有")
                 return None
-            except Exception as e:
-                print(f"获取歌单详情时出错: {e}")
-                if attempt < max_retries - 1:
-                    print("等待3秒后重试...")
-                    time.sleep(3)
-                    continue
+            elif response.status_code != 200:
+                print(f"API服务器返回错误: HTTP {response.status_code}")
                 return None
-        
-        print("所有重试都失败了")
-        return None
+
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+
+            if data.get('code') == 200:
+                playlist = data.get('playlist', {})
+                if playlist:
+                    print(f"成功获取歌单信息")
+                    return playlist
+                else:
+                    print("API返回成功但歌单信息为空")
+                    return None
+            else:
+                print(f"获取歌单详情失败: {data.get('msg', '未知错误')}")
+                return None
+
+        except requests.exceptions.Timeout:
+            print("请求超时")
+            return None
+        except requests.exceptions.ConnectionError:
+            print("网络连接错误")
+            return None
+        except Exception as e:
+            print(f"获取歌单详情时出错: {e}")
+            return None
     
-    def get_playlist_tracks(self, playlist_id):
-        """获取歌单中的所有歌曲 - 使用playlist/detail + song/detail的方式"""
+    def _fetch_detail_batch(self, batch_ids):
+        """请求一批歌曲的song/detail，返回歌曲列表（失败时返回空列表）"""
         try:
-            # 第一步：获取歌单详情，包含trackIds
-            print(f"🔍 第一步：获取歌单详情...")
-            url = f"{self.base_url}/playlist/detail"
-            data = {'id': playlist_id}
-            
-            print(f"🔍 调试信息 - 请求URL: {url}")
-            print(f"🔍 调试信息 - 请求参数: {data}")
-            print(f"🔍 调试信息 - 请求方法: POST")
-            
+            self._throttle()
+            url = f"{self.base_url}/song/detail"
+            data = {'ids': ','.join(map(str, batch_ids))}
+
+            logger.debug("请求URL: %s 参数: %s", url, data)
+
             response = self.session.post(url, data=data, timeout=30)
-            
-            print(f"🔍 调试信息 - 响应状态码: {response.status_code}")
-            
+            self._report_response(response.status_code)
+
+            logger.debug("响应状态码: %s", response.status_code)
+
             if response.status_code != 200:
-                print(f"❌ 获取歌单详情失败: HTTP {response.status_code}")
+                print(f"❌ 获取歌曲详情失败: HTTP {response.status_code}")
                 return []
-            
+
             response.raise_for_status()
-            result = response.json()
-            
-            print(f"🔍 调试信息 - 歌单详情API响应: {json.dumps(result, ensure_ascii=False, indent=2)}")
-            
+            result = orjson.loads(response.content)
+
+            logger.debug("歌曲详情API响应: %s", result)
+
             if result.get('code') != 200:
-                print(f"❌ 获取歌单详情失败: {result.get('msg', '未知错误')}")
+                print(f"❌ 获取歌曲详情失败: {result.get('msg', '未知错误')}")
                 return []
-            
-            playlist = result.get('playlist', {})
-            track_ids = playlist.get('trackIds', [])
-            
+
+            songs = result.get('songs', [])
+            # 歌手名在接收时拼接一次缓存到歌曲dict上，后续各处直接取用
+            for s in songs:
+                s['_artists'] = ', '.join(a.get('name', '') for a in s.get('ar', ())) or '未知歌手'
+            return songs
+
+        except Exception as e:
+            print(f"❌ 获取歌曲详情时出错: {e}")
+            return []
+
+    def get_playlist_tracks(self, playlist_detail):
+        """获取歌单中的所有歌曲 - 复用已获取的歌单详情里的trackIds，批量请求song/detail"""
+        try:
+            # 歌单详情在process_playlist里已经取过一次，直接用，不再重复请求
+            track_ids = playlist_detail.get('trackIds', [])
+
             if not track_ids:
                 print("❌ 歌单中没有找到歌曲")
                 return []
             
             print(f"✅ 找到 {len(track_ids)} 首歌曲的ID")
-            print(f"🔍 前5个trackIds: {track_ids[:5]}")
+            logger.debug("前5个trackIds: %s", track_ids[:5])
             
-            # 第二步：使用trackIds获取歌曲详情
-            print(f"🔍 第二步：获取歌曲详情...")
+            # 使用trackIds批量获取歌曲详情，每批50首，4批并发
+            # 各批相互独立，按批次起始位置合并结果以保持歌单顺序
+            print(f"🔍 获取歌曲详情...")
             song_ids = [track['id'] for track in track_ids]
-            
-            # 分批获取歌曲详情，每批50首
+
             batch_size = 50
-            all_songs = []
-            
-            for i in range(0, len(song_ids), batch_size):
-                batch_ids = song_ids[i:i+batch_size]
-                print(f"🔍 正在获取第 {i+1}-{min(i+batch_size, len(song_ids))} 首歌曲详情...")
-                
-                url = f"{self.base_url}/song/detail"
-                data = {'ids': ','.join(map(str, batch_ids))}
-                
-                print(f"🔍 调试信息 - 请求URL: {url}")
-                print(f"🔍 调试信息 - 请求参数: {data}")
-                print(f"🔍 调试信息 - 请求方法: POST")
-                
-                response = self.session.post(url, data=data, timeout=30)
-                
-                print(f"🔍 调试信息 - 响应状态码: {response.status_code}")
-                
-                if response.status_code != 200:
-                    print(f"❌ 获取歌曲详情失败: HTTP {response.status_code}")
-                    continue
-                
-                response.raise_for_status()
-                result = response.json()
-                
-                print(f"🔍 调试信息 - 歌曲详情API响应: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                
-                if result.get('code') == 200:
-                    songs = result.get('songs', [])
-                    all_songs.extend(songs)
-                    print(f"✅ 成功获取 {len(songs)} 首歌曲详情")
-                    print(f"🔍 前3首歌曲信息:")
-                    for j, song in enumerate(songs[:3]):
-                        print(f"   {j+1}. ID:{song.get('id')} - {song.get('name')} - {[ar.get('name') for ar in song.get('ar', [])]}")
-                else:
-                    print(f"❌ 获取歌曲详情失败: {result.get('msg', '未知错误')}")
-                
-                # 短暂延迟避免请求过快
-                time.sleep(0.5)
-            
+            # 预分配结果列表，各批按起始位置切片写入，省去收集后再排序合并
+            all_songs = [None] * len(song_ids)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = {
+                    executor.submit(self._fetch_detail_batch, song_ids[i:i+batch_size]): i
+                    for i in range(0, len(song_ids), batch_size)
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    songs = future.result()
+                    all_songs[i:i+len(songs)] = songs
+            # 某批失败或被过滤时会留下空位，过滤掉
+            all_songs = [s for s in all_songs if s is not None]
+
             print(f"✅ 总共获取到 {len(all_songs)} 首歌曲")
             return all_songs
                 
@@ -245,92 +349,129 @@ class NeteaseMusicDownloader:
             return []
     
     def get_song_url_v1(self, song_id, quality_level):
-        """获取歌曲直链 - 使用新版API支持不同音质"""
-        max_retries = 2
-        for attempt in range(max_retries):
-            try:
-                url = f"{self.base_url}/song/url/v1"
-                data = {
-                    'id': song_id,
-                    'level': quality_level
-                }
-                
-                # 添加随机延迟避免缓存
-                import random
-                delay = random.uniform(1.0, 3.0)
-                print(f"⏳ 等待 {delay:.1f} 秒避免缓存...")
-                time.sleep(delay)
-                
-                # 添加随机User-Agent避免被识别为机器人
-                random_ua = f'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{random.randint(90, 120)}.0.0.0 Safari/537.36'
-                self.session.headers.update({'User-Agent': random_ua})
-                
-                print(f"🔍 调试信息 - 请求URL: {url}")
-                print(f"🔍 调试信息 - 请求参数: {data}")
-                print(f"🔍 调试信息 - 请求方法: POST")
-                print(f"🔍 调试信息 - User-Agent: {random_ua}")
-                
-                # 尝试使用GET请求
-                response = self.session.get(url, params=data, timeout=15)
-                
-                print(f"🔍 调试信息 - 响应状态码: {response.status_code}")
-                print(f"🔍 调试信息 - 响应头: {dict(response.headers)}")
-                
-                if response.status_code != 200:
-                    print(f"❌ 请求失败，状态码: {response.status_code}")
-                    if attempt < max_retries - 1:
-                        print(f"⏳ 等待0.5秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                        time.sleep(0.5)
-                        continue
-                    return None
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                print(f"🔍 调试信息 - API响应: {json.dumps(data, ensure_ascii=False, indent=2)}")
-                
-                if data.get('code') == 200 and data.get('data'):
-                    song_data = data['data'][0]
-                    if song_data.get('url'):
-                        result = {
-                            'url': song_data['url'],
-                            'level': quality_level,
-                            'br': song_data.get('br', 0),  # 比特率
-                            'size': song_data.get('size', 0),  # 文件大小
-                            'type': song_data.get('type', ''),  # 文件类型
-                            'song_id': song_id  # 添加歌曲ID用于调试
-                        }
-                        print(f"✅ 成功获取直链: {result['url'][:50]}...")
-                        return result
-                    else:
-                        print(f"❌ API返回成功但URL为空")
-                        return None
+        """获取歌曲直链 - 使用新版API支持不同音质（瞬时错误由连接池的Retry自动重试）"""
+        # 命中未过期的缓存时不发请求
+        cached = self._cache_get(song_id, quality_level)
+        if cached:
+            logger.debug("直链缓存命中: %s (%s)", song_id, quality_level)
+            return cached
+
+        try:
+            url = f"{self.base_url}/song/url/v1"
+            data = {
+                'id': song_id,
+                'level': quality_level
+            }
+
+            # 只在服务器真的限流时才放慢，正常情况下几乎不等待
+            self._throttle()
+
+            logger.debug("请求URL: %s 参数: %s", url, data)
+
+            response = self.session.get(url, params=data, timeout=15)
+            self._report_response(response.status_code)
+
+            logger.debug("响应状态码: %s", response.status_code)
+
+            if response.status_code != 200:
+                print(f"❌ 请求失败，状态码: {response.status_code}")
+                return None
+
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+
+            logger.debug("直链API响应: %s", data)
+
+            if data.get('code') == 200 and data.get('data'):
+                song_data = data['data'][0]
+                if song_data.get('url'):
+                    result = UrlInfo(
+                        url=song_data['url'],
+                        level=quality_level,
+                        br=song_data.get('br', 0),
+                        size=song_data.get('size', 0),
+                        type=song_data.get('type', ''),
+                        song_id=song_id
+                    )
+                    print(f"✅ 成功获取直链: {result.url[:50]}...")
+                    self._cache_put(result)
+                    return result
                 else:
-                    print(f"❌ API返回错误: code={data.get('code')}, msg={data.get('msg', '未知错误')}")
-                    if attempt < max_retries - 1:
-                        print(f"⏳ 等待0.5秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                        time.sleep(0.5)
-                        continue
+                    print(f"❌ API返回成功但URL为空")
                     return None
-                    
-            except Exception as e:
-                print(f"❌ 请求异常: {e}")
-                if attempt < max_retries - 1:
-                    print(f"⏳ 等待0.5秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                    time.sleep(0.5)
-                    continue
+            else:
+                print(f"❌ API返回错误: code={data.get('code')}, msg={data.get('msg', '未知错误')}")
                 return None
-        
-        print(f"❌ 所有重试都失败了")
-        return None
+
+        except Exception as e:
+            print(f"❌ 请求异常: {e}")
+            return None
     
+    def get_song_urls_batch(self, song_ids, quality_level):
+        """批量获取歌曲直链 - /song/url/v1 的id参数支持逗号分隔列表（同song/detail的批量方式）
+
+        返回 {歌曲ID: 直链信息}，未拿到直链的歌曲不在结果里
+        """
+        # 先查缓存，只请求未命中的id
+        url_map = {}
+        missing = []
+        for song_id in song_ids:
+            cached = self._cache_get(song_id, quality_level)
+            if cached:
+                url_map[song_id] = cached
+            else:
+                missing.append(song_id)
+
+        if not missing:
+            logger.debug("本批 %d 首全部命中直链缓存", len(song_ids))
+            return url_map
+
+        try:
+            self._throttle()
+            url = f"{self.base_url}/song/url/v1"
+            data = {
+                'id': ','.join(map(str, missing)),
+                'level': quality_level
+            }
+
+            response = self.session.post(url, data=data, timeout=30)
+            self._report_response(response.status_code)
+
+            if response.status_code != 200:
+                print(f"❌ 批量获取直链失败: HTTP {response.status_code}")
+                return url_map
+
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+
+            if result.get('code') != 200:
+                print(f"❌ 批量获取直链失败: {result.get('msg', '未知错误')}")
+                return url_map
+
+            for song_data in result.get('data', []):
+                if song_data.get('url'):
+                    url_info = UrlInfo(
+                        url=song_data['url'],
+                        level=quality_level,
+                        br=song_data.get('br', 0),
+                        size=song_data.get('size', 0),
+                        type=song_data.get('type', ''),
+                        song_id=song_data['id']
+                    )
+                    url_map[song_data['id']] = url_info
+                    self._cache_put(url_info)
+            return url_map
+
+        except Exception as e:
+            print(f"❌ 批量获取直链时出错: {e}")
+            return url_map
+
     def process_single_song(self, song, quality_level):
         """处理单首歌曲 - 用于多线程"""
         song_id = song.get('id')
         song_name = song.get('name', '未知歌曲')
-        artists = [artist.get('name', '') for artist in song.get('ar', [])]
-        artist_names = ', '.join(artists) if artists else '未知歌手'
-        
+        artist_names = song.get('_artists', '未知歌手')
+
         # 获取歌曲直链
         url_info = self.get_song_url_v1(song_id, quality_level)
         
@@ -340,15 +481,15 @@ class NeteaseMusicDownloader:
             total = self.total_count
             
             if url_info:
-                print(f"[{current}/{total}] ✓ {song_name} - {artist_names} (ID:{song_id}, {quality_level}, {url_info['br']}kbps)")
+                print(f"[{current}/{total}] ✓ {song_name} - {artist_names} (ID:{song_id}, {quality_level}, {url_info.br}kbps)")
                 return {
                     'name': song_name,
                     'artist': artist_names,
-                    'url': url_info['url'],
+                    'url': url_info.url,
                     'quality': quality_level,
-                    'bitrate': url_info['br'],
-                    'size': url_info['size'],
-                    'type': url_info['type'],
+                    'bitrate': url_info.br,
+                    'size': url_info.size,
+                    'type': url_info.type,
                     'song_id': song_id
                 }
             else:
@@ -393,8 +534,8 @@ class NeteaseMusicDownloader:
         playlist_name = playlist_detail.get('name', '未知歌单')
         print(f"歌单名称: {playlist_name}")
         
-        # 获取歌单中的所有歌曲
-        songs_detail = self.get_playlist_tracks(playlist_id)
+        # 获取歌单中的所有歌曲（复用上面拿到的歌单详情，省一次API往返）
+        songs_detail = self.get_playlist_tracks(playlist_detail)
         if not songs_detail:
             print("无法获取歌单歌曲")
             return
@@ -412,46 +553,52 @@ class NeteaseMusicDownloader:
         # 初始化文件
         self.init_file(playlist_name, quality_level)
         
-        # 使用单线程处理歌曲，每获取一首就保存到文件
+        # 批量获取直链：一次请求拿50首，把N个往返压缩成N/50个
+        batch_size = 50
+        song_ids = [song.get('id') for song in songs_detail]
+
+        print(f"\n开始批量获取直链，每批 {batch_size} 首，4批并发...")
+
+        # 各批次相互独立，用线程池并发请求；限速器和连接池都是线程安全的
+        # 进度统一走一个tqdm进度条，避免每首歌刷好几行屏
+        url_map = {}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = {
+                executor.submit(self.get_song_urls_batch, song_ids[i:i+batch_size], quality_level):
+                    len(song_ids[i:i+batch_size])
+                for i in range(0, len(song_ids), batch_size)
+            }
+            with tqdm(total=len(song_ids), desc="获取直链", unit="首") as pbar:
+                for future in as_completed(futures):
+                    url_map.update(future.result())
+                    pbar.update(futures[future])
+
+        # 按歌单顺序写入文件
         success_count = 0
-        
-        print(f"\n开始单线程处理歌曲...")
-        print(f"总共需要处理 {len(songs_detail)} 首歌曲")
-        
         for i, song in enumerate(songs_detail, 1):
-            print(f"\n正在处理第 {i}/{len(songs_detail)} 首歌曲...")
-            
             song_id = song.get('id')
             song_name = song.get('name', '未知歌曲')
-            artists = [artist.get('name', '') for artist in song.get('ar', [])]
-            artist_names = ', '.join(artists) if artists else '未知歌手'
-            
-            print(f"歌曲信息: {song_name} - {artist_names} (ID: {song_id})")
-            
-            # 获取歌曲直链
-            url_info = self.get_song_url_v1(song_id, quality_level)
-            
+            artist_names = song.get('_artists', '未知歌手')
+
+            url_info = url_map.get(song_id)
             if url_info:
-                print(f"✓ 成功获取直链: {url_info['br']}kbps")
+                logger.debug("[%d/%d] ✓ %s - %s (%skbps)", i, len(songs_detail), song_name, artist_names, url_info.br)
                 song_info = {
                     'name': song_name,
                     'artist': artist_names,
-                    'url': url_info['url'],
+                    'url': url_info.url,
                     'quality': quality_level,
-                    'bitrate': url_info['br'],
-                    'size': url_info['size'],
-                    'type': url_info['type'],
+                    'bitrate': url_info.br,
+                    'size': url_info.size,
+                    'type': url_info.type,
                     'song_id': song_id
                 }
-                
+
                 # 立即保存到文件
                 self.append_song_to_file(song_info, i)
                 success_count += 1
             else:
-                print(f"✗ 无法获取直链")
-            
-            # 每处理一首歌后短暂延迟
-            time.sleep(0.5)
+                print(f"✗ {song_name} - {artist_names} (无法获取直链)")
         
         # 更新文件统计信息
         self.update_file_summary(success_count)
@@ -460,69 +607,36 @@ class NeteaseMusicDownloader:
         print(f"✓ 所有信息已保存到 list.txt")
     
     def init_file(self, playlist_name, quality_level):
-        """初始化文件，写入头部信息"""
+        """初始化文件，写入头部信息（文件句柄保持打开，整个处理过程只打开/关闭一次）"""
         try:
             filename = "list.txt"
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"# 歌单: {playlist_name}\n")
-                f.write(f"# 音质: {quality_level}\n")
-                f.write(f"# 生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write("=" * 50 + "\n\n")
+            self._fh = open(filename, 'w', buffering=64 * 1024, encoding='utf-8')
+            self._fh.write(f"# 歌单: {playlist_name}\n")
+            self._fh.write(f"# 音质: {quality_level}\n")
+            self._fh.write(f"# 生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            self._fh.write("=" * 50 + "\n\n")
             print(f"✓ 初始化文件: {filename}")
         except Exception as e:
             print(f"初始化文件时出错: {e}")
-    
+
     def append_song_to_file(self, song, index):
-        """将单首歌曲添加到文件"""
+        """将单首歌曲写入已打开的文件"""
         try:
-            filename = "list.txt"
-            with open(filename, 'a', encoding='utf-8') as f:
-                f.write(f"{index}. {song['name']} - {song['artist']}\n")
-                f.write(f"   歌曲ID: {song.get('song_id', '未知')}\n")
-                f.write(f"   音质: {song['quality']} ({song['bitrate']}kbps)\n")
-                f.write(f"   直链: {song['url']}\n")
-                f.write(f"   大小: {song['size']} bytes\n")
-                f.write(f"   类型: {song['type']}\n")
-                f.write(f"   下载说明: 此直链需要添加Referer请求头才能正常访问\n")
-                f.write(f"   推荐下载工具: IDM、Aria2、curl等支持自定义请求头的工具\n")
-                f.write(f"   必要请求头: Referer: https://music.163.com/\n")
-                f.write(f"   User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36\n")
-                f.write("\n")
-            
-            print(f"✓ 已保存到文件: {song['name']} - {song['artist']}")
+            self._fh.write(self._SONG_TMPL.format_map({'song_id': '未知', **song, 'index': index}))
+
+            logger.debug("已保存到文件: %s - %s", song['name'], song['artist'])
         except Exception as e:
             print(f"保存歌曲到文件时出错: {e}")
-    
+
     def update_file_summary(self, total_count):
-        """更新文件末尾的统计信息"""
+        """在文件末尾追加统计信息并关闭文件"""
         try:
-            filename = "list.txt"
-            with open(filename, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # 找到头部信息的位置
-            header_end = 0
-            for i, line in enumerate(lines):
-                if line.startswith("=" * 50):
-                    header_end = i + 2
-                    break
-            
-            # 重新写入文件
-            with open(filename, 'w', encoding='utf-8') as f:
-                # 写入头部信息
-                for i in range(header_end):
-                    f.write(lines[i])
-                
-                # 写入歌曲信息
-                song_lines = lines[header_end:]
-                f.writelines(song_lines)
-                
-                # 添加统计信息
-                f.write(f"\n" + "=" * 50 + "\n")
-                f.write(f"# 统计信息\n")
-                f.write(f"# 成功获取直链的歌曲: {total_count} 首\n")
-                f.write(f"# 完成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            
+            self._fh.write("\n" + "=" * 50 + "\n")
+            self._fh.write(f"# 统计信息\n")
+            self._fh.write(f"# 成功获取直链的歌曲: {total_count} 首\n")
+            self._fh.write(f"# 完成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            self._fh.close()
+            self._fh = None
         except Exception as e:
             print(f"更新文件统计信息时出错: {e}")
     
@@ -554,36 +668,38 @@ class NeteaseMusicDownloader:
             print(f"保存文件时出错: {e}")
 
 def main():
+    # 需要查看API原始响应时把级别改成DEBUG
+    logging.basicConfig(level=logging.INFO)
+
     print("网易云音乐歌单歌曲直链提取器 (多线程版)")
     print("=" * 50)
     
-    downloader = NeteaseMusicDownloader()
-    
-    while True:
-        print("\n请输入网易云音乐歌单链接或歌单ID:")
-        print("示例链接: https://music.163.com/#/playlist?id=24381616")
-        print("示例ID: 24381616")
-        print("输入 'quit' 退出程序")
-        
-        user_input = input("\n请输入: ").strip()
-        
-        if user_input.lower() in ['quit', 'exit', '退出']:
-            print("程序退出")
-            break
-        
-        if not user_input:
-            print("输入不能为空，请重新输入")
-            continue
-        
-        print("\n开始处理歌单...")
-        
-        # 检查API服务器状态
-        if not downloader.check_api_status():
-            print("API服务器不可用，请稍后再试")
-            continue
-        
-        downloader.process_playlist(user_input)
-        print("\n处理完成!")
+    with NeteaseMusicDownloader() as downloader:
+        while True:
+            print("\n请输入网易云音乐歌单链接或歌单ID:")
+            print("示例链接: https://music.163.com/#/playlist?id=24381616")
+            print("示例ID: 24381616")
+            print("输入 'quit' 退出程序")
+
+            user_input = input("\n请输入: ").strip()
+
+            if user_input.lower() in ['quit', 'exit', '退出']:
+                print("程序退出")
+                break
+
+            if not user_input:
+                print("输入不能为空，请重新输入")
+                continue
+
+            print("\n开始处理歌单...")
+
+            # 检查API服务器状态
+            if not downloader.check_api_status():
+                print("API服务器不可用，请稍后再试")
+                continue
+
+            downloader.process_playlist(user_input)
+            print("\n处理完成!")
 
 if __name__ == "__main__":
     try:
@@ -21,8 +21,8 @@ def main():
     print("网易云音乐歌单歌曲直链提取器")
     print("=" * 40)
     
-    downloader = NeteaseMusicDownloader()
-    downloader.process_playlist(playlist_input)
+    with NeteaseMusicDownloader() as downloader:
+        downloader.process_playlist(playlist_input)
     
     print("\n程序执行完成!")
 